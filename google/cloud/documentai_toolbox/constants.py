@@ -27,12 +27,24 @@ BATCH_MAX_FILES = 50
 BATCH_MAX_FILE_SIZE = 1073741824
 BATCH_MAX_REQUESTS = 5
 
+# https://cloud.google.com/storage/docs/json_api/v1/objects/list
+GCS_LIST_PAGE_SIZE = 1000
+# Partial response with only the attributes needed to create batches.
+GCS_LIST_FIELDS = "items(name,size,contentType),nextPageToken"
+GCS_LIST_FIELDS_WITH_PREFIXES = "items(name,size,contentType),prefixes,nextPageToken"
+GCS_LIST_NAME_FIELDS = "items(name),nextPageToken"
+# Connections kept open per host by the shared Storage client.
+GCS_HTTP_POOL_MAXSIZE = 32
+
 # https://cloud.google.com/document-ai/docs/file-types
-VALID_MIME_TYPES = {
-    "application/pdf",
-    "image/bmp" "image/gif",
-    "image/jpeg",
-    "image/png",
-    "image/tiff",
-    "image/webp",
-}
+VALID_MIME_TYPES = frozenset(
+    {
+        "application/pdf",
+        "image/bmp",
+        "image/gif",
+        "image/jpeg",
+        "image/png",
+        "image/tiff",
+        "image/webp",
+    }
+)
@@ -14,15 +14,32 @@
 # limitations under the License.
 #
 """Document AI utilities."""
+import bisect
+import collections
+from concurrent import futures
+import functools
+import itertools
+import logging
 import os
 import re
-from typing import Dict, List, Optional
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from google.cloud import documentai
+from google.cloud import storage
+from google.cloud.storage import retry as storage_retry
+from requests import adapters
 
 from google.cloud.documentai_toolbox import constants
 from google.cloud.documentai_toolbox.wrappers.document import _get_storage_client
 
+logger = logging.getLogger(__name__)
+
+# Retries the same transient errors as the Storage default, with shorter delays.
+# `Retry` adds jitter to each delay.
+_LIST_BLOBS_RETRY = storage_retry.DEFAULT_RETRY.with_delay(
+    initial=0.1, maximum=2.0, multiplier=2.0
+)
+
 
 def print_gcs_document_tree(gcs_bucket_name: str, gcs_prefix: str) -> None:
     r"""Prints a tree of filenames in Cloud Storage folder.
@@ -50,7 +67,9 @@ def print_gcs_document_tree(gcs_bucket_name: str, gcs_prefix: str) -> None:
         raise ValueError("gcs_prefix cannot contain file types")
 
     storage_client = _get_storage_client()
-    blob_list = storage_client.list_blobs(gcs_bucket_name, prefix=gcs_prefix)
+    blob_list = storage_client.list_blobs(
+        gcs_bucket_name, prefix=gcs_prefix, fields=constants.GCS_LIST_NAME_FIELDS
+    )
 
     path_list: Dict[str, List[str]] = {}
 
@@ -74,12 +93,288 @@ def print_gcs_document_tree(gcs_bucket_name: str, gcs_prefix: str) -> None:
                 print(f"{FILENAME_TREE_MIDDLE}{file_name}")
 
 
-def create_batches(
+@functools.lru_cache(maxsize=1)
+def _get_shared_storage_client() -> storage.Client:
+    r"""Returns a Storage client that is reused across calls.
+
+    The connection pool is sized for concurrent listing, unless the session uses a custom
+    adapter such as the mutual TLS one, which is kept as is. Call
+    `_get_shared_storage_client.cache_clear()` to create a new client on the next call.
+
+    Returns:
+        storage.Client.
+
+    """
+    storage_client = _get_storage_client()
+    session = storage_client._http
+    if type(session.get_adapter("https://")) is adapters.HTTPAdapter:
+        session.mount(
+            "https://",
+            adapters.HTTPAdapter(pool_maxsize=constants.GCS_HTTP_POOL_MAXSIZE),
+        )
+    return storage_client
+
+
+def _as_folder_prefix(gcs_prefix: str) -> str:
+    r"""Returns `gcs_prefix` with a trailing `/`, so that listing it with a delimiter returns its contents.
+
+    Args:
+        gcs_prefix (str):
+            Required. The prefix of the folder.
+
+            Format: `optional_folder/target_folder` or `optional_folder/target_folder/`.
+
+    Returns:
+        str:
+            The prefix ending with `/`, or an empty string for the root of the bucket.
+
+    """
+    if gcs_prefix and not gcs_prefix.endswith("/"):
+        return gcs_prefix + "/"
+    return gcs_prefix
+
+
+def _list_blob_pages(
+    storage_client: storage.Client,
+    gcs_bucket_name: str,
+    gcs_prefix: str,
+    delimiter: Optional[str] = None,
+) -> Iterator[Iterable[storage.Blob]]:
+    r"""Returns an iterator over the pages of blobs under a prefix.
+
+    Args:
+        storage_client (storage.Client):
+            Required. The Storage client used to list the blobs.
+        gcs_bucket_name (str):
+            Required. The name of the gcs bucket.
+        gcs_prefix (str):
+            Required. The prefix of the blobs to list.
+        delimiter (Optional[str]):
+            Optional. Delimiter used to omit the blobs in sub-folders of `gcs_prefix`.
+            Default is `None`, which lists all blobs recursively.
+
+    Returns:
+        Iterator[Iterable[storage.Blob]]:
+            An iterator over the pages of blobs.
+
+    """
+    blob_list = storage_client.list_blobs(
+        gcs_bucket_name,
+        prefix=gcs_prefix,
+        delimiter=delimiter,
+        page_size=constants.GCS_LIST_PAGE_SIZE,
+        retry=_LIST_BLOBS_RETRY,
+        fields=constants.GCS_LIST_FIELDS,
+    )
+    return blob_list.pages
+
+
+def _list_blob_pages_concurrently(
+    storage_client: storage.Client,
+    gcs_bucket_name: str,
+    gcs_prefix: str,
+    max_workers: int,
+) -> Iterator[Iterable[storage.Blob]]:
+    r"""Returns an iterator over lists of blobs under a prefix, listing each sub-prefix in its own thread.
+
+    At most `max_workers` sub-prefixes are listed ahead of the consumer, and each of them is
+    held in memory in full until it is consumed. The blobs that are not in a sub-prefix are
+    also held in memory. Closing the iterator early waits for the listings in progress.
+
+    Args:
+        storage_client (storage.Client):
+            Required. The Storage client used to list the blobs.
+        gcs_bucket_name (str):
+            Required. The name of the gcs bucket.
+        gcs_prefix (str):
+            Required. The prefix of the blobs to list.
+        max_workers (int):
+            Required. The maximum number of sub-prefixes to list at the same time.
+
+    Returns:
+        Iterator[Iterable[storage.Blob]]:
+            An iterator over lists of blobs, in the same order as a sequential listing.
+
+    """
+
+    def list_first_level(prefix: str) -> Tuple[List[storage.Blob], Set[str]]:
+        blob_list = storage_client.list_blobs(
+            gcs_bucket_name,
+            prefix=prefix,
+            delimiter="/",
+            page_size=constants.GCS_LIST_PAGE_SIZE,
+            retry=_LIST_BLOBS_RETRY,
+            fields=constants.GCS_LIST_FIELDS_WITH_PREFIXES,
+        )
+        # `prefixes` is only populated once the pages have been consumed.
+        blobs = list(itertools.chain.from_iterable(blob_list.pages))
+        return blobs, set(blob_list.prefixes)
+
+    root_blobs, prefixes = list_first_level(gcs_prefix)
+
+    # `gcs_prefix` is usually a folder without its trailing `/`, which the delimiter
+    # returns as a single prefix. Expand it one level so that its contents are split
+    # between the workers.
+    folder_prefix = _as_folder_prefix(gcs_prefix)
+    if folder_prefix != gcs_prefix and folder_prefix in prefixes:
+        folder_blobs, folder_prefixes = list_first_level(folder_prefix)
+        prefixes.remove(folder_prefix)
+        prefixes.update(folder_prefixes)
+        root_blobs = sorted(root_blobs + folder_blobs, key=lambda blob: blob.name)
+
+    sub_prefixes = sorted(prefixes)
+    if not sub_prefixes:
+        yield root_blobs
+        return
+
+    def list_sub_prefix(sub_prefix: str) -> List[storage.Blob]:
+        return list(
+            itertools.chain.from_iterable(
+                _list_blob_pages(storage_client, gcs_bucket_name, sub_prefix)
+            )
+        )
+
+    # Cloud Storage lists blobs in lexicographic order, and a blob that is not in a
+    # sub-prefix sorts either before or after every blob of that sub-prefix.
+    root_names = [blob.name for blob in root_blobs]
+    root_start = 0
+
+    with futures.ThreadPoolExecutor(
+        max_workers=min(max_workers, len(sub_prefixes))
+    ) as executor:
+        pending_prefixes = iter(sub_prefixes)
+        pending: Deque[Tuple[str, futures.Future]] = collections.deque(
+            (sub_prefix, executor.submit(list_sub_prefix, sub_prefix))
+            for sub_prefix in itertools.islice(pending_prefixes, max_workers)
+        )
+        try:
+            while pending:
+                sub_prefix, future = pending.popleft()
+                for next_prefix in itertools.islice(pending_prefixes, 1):
+                    pending.append(
+                        (next_prefix, executor.submit(list_sub_prefix, next_prefix))
+                    )
+
+                root_end = bisect.bisect_left(root_names, sub_prefix, root_start)
+                if root_end > root_start:
+                    yield root_blobs[root_start:root_end]
+                root_start = root_end
+
+                yield future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    if root_start < len(root_blobs):
+        yield root_blobs[root_start:]
+
+
+def _log_skipped_blobs(blobs: Iterable[storage.Blob]) -> None:
+    r"""Logs a warning for each file that cannot be batch processed.
+
+    Args:
+        blobs (Iterable[storage.Blob]):
+            Required. The blobs to check.
+
+    Returns:
+        None.
+
+    """
+    for blob in blobs:
+        # Skip Directories
+        if blob.name[-1] == "/":
+            continue
+
+        if blob.content_type not in constants.VALID_MIME_TYPES:
+            logger.warning(
+                "Skipping file %s. Invalid Mime Type %s.", blob.name, blob.content_type
+            )
+        elif blob.size > constants.BATCH_MAX_FILE_SIZE:
+            logger.warning(
+                "Skipping file %s. File size must be less than %d bytes. File size is %d bytes.",
+                blob.name,
+                constants.BATCH_MAX_FILE_SIZE,
+                blob.size,
+            )
+
+
+def _gcs_document_pages(
+    blob_pages: Iterator[Iterable[storage.Blob]], gcs_bucket_name: str
+) -> Iterator[List[documentai.GcsDocument]]:
+    r"""Returns an iterator over the blobs that can be batch processed, as pages of `GcsDocument`.
+
+    Args:
+        blob_pages (Iterator[Iterable[storage.Blob]]):
+            Required. The pages of blobs to filter.
+        gcs_bucket_name (str):
+            Required. The name of the gcs bucket containing the blobs.
+
+    Returns:
+        Iterator[List[documentai.GcsDocument]]:
+            An iterator over the documents with a valid mime type and file size, one list per page.
+
+    """
+    uri_prefix = f"gs://{gcs_bucket_name}/"
+    valid_mime_types = constants.VALID_MIME_TYPES
+    max_file_size = constants.BATCH_MAX_FILE_SIZE
+    GcsDocument = documentai.GcsDocument
+
+    for page in blob_pages:
+        blobs = list(page)
+        documents = [
+            GcsDocument(gcs_uri=uri_prefix + blob.name, mime_type=blob.content_type)
+            for blob in blobs
+            if blob.name[-1] != "/"
+            and blob.content_type in valid_mime_types
+            and blob.size <= max_file_size
+        ]
+        # Reasons are only worked out for pages where files were skipped.
+        if len(documents) < len(blobs) and logger.isEnabledFor(logging.WARNING):
+            _log_skipped_blobs(blobs)
+
+        yield documents
+
+
+def _batches_from_documents(
+    documents: Iterator[documentai.GcsDocument], batch_size: int
+) -> Iterator[documentai.BatchDocumentsInputConfig]:
+    r"""Returns an iterator over batches of at most `batch_size` documents.
+
+    Args:
+        documents (Iterator[documentai.GcsDocument]):
+            Required. The documents to batch.
+        batch_size (int):
+            Required. Size of each batch of documents.
+
+    Returns:
+        Iterator[documentai.BatchDocumentsInputConfig]:
+            An iterator over `BatchDocumentsInputConfig`, each corresponding to one batch.
+
+    """
+    BatchDocumentsInputConfig = documentai.BatchDocumentsInputConfig
+    GcsDocuments = documentai.GcsDocuments
+
+    while True:
+        batch = list(itertools.islice(documents, batch_size))
+        if not batch:
+            return
+
+        yield BatchDocumentsInputConfig(gcs_documents=GcsDocuments(documents=batch))
+
+
+def iter_batches(
     gcs_bucket_name: str,
     gcs_prefix: str,
     batch_size: Optional[int] = constants.BATCH_MAX_FILES,
-) -> List[documentai.BatchDocumentsInputConfig]:
-    """Create batches of documents in Cloud Storage to process with `batch_process_documents()`.
+    max_workers: Optional[int] = None,
+    recursive: Optional[bool] = True,
+) -> Iterator[documentai.BatchDocumentsInputConfig]:
+    """Lazily create batches of documents in Cloud Storage to process with `batch_process_documents()`.
+
+    Unlike `create_batches()`, only one listing page of up to 1000 documents and the batch
+    being built are held in memory. When `max_workers` is set, the files outside of the
+    sub-folders of `gcs_prefix` and the listings of up to `max_workers` sub-folders are
+    held in memory instead of a single page.
 
     Args:
         gcs_bucket_name (str):
@@ -92,57 +387,85 @@ def create_batches(
             Format: `gs://bucket/optional_folder/target_folder/` where gcs_prefix=`optional_folder/target_folder`.
         batch_size (Optional[int]):
             Optional. Size of each batch of documents. Default is `50`.
+        max_workers (Optional[int]):
+            Optional. Maximum number of threads used to list the sub-folders of `gcs_prefix`
+            concurrently. Default is `None`, which lists all documents sequentially.
+        recursive (Optional[bool]):
+            Optional. Whether to include documents in sub-folders of `gcs_prefix`. Default is `True`.
+            `max_workers` is ignored when `False`.
 
     Returns:
-        List[documentai.BatchDocumentsInputConfig]:
-            A list of `BatchDocumentsInputConfig`, each corresponding to one batch.
+        Iterator[documentai.BatchDocumentsInputConfig]:
+            An iterator over `BatchDocumentsInputConfig`, each corresponding to one batch.
     """
-    if batch_size > constants.BATCH_MAX_FILES:
+    if not 0 < batch_size <= constants.BATCH_MAX_FILES:
         raise ValueError(
-            f"Batch size must be less than {constants.BATCH_MAX_FILES}. You provided {batch_size}."
+            f"Batch size must be between 1 and {constants.BATCH_MAX_FILES}. You provided {batch_size}."
         )
 
-    storage_client = _get_storage_client()
-    blob_list = storage_client.list_blobs(gcs_bucket_name, prefix=gcs_prefix)
-    batches: List[documentai.BatchDocumentsInputConfig] = []
-    batch: List[documentai.GcsDocument] = []
+    if max_workers is not None and max_workers < 1:
+        raise ValueError(
+            f"max_workers must be greater than 0. You provided {max_workers}."
+        )
 
-    for blob in blob_list:
-        # Skip Directories
-        if blob.name.endswith("/"):
-            continue
+    storage_client = _get_shared_storage_client()
+    if not recursive:
+        blob_pages = _list_blob_pages(
+            storage_client,
+            gcs_bucket_name,
+            _as_folder_prefix(gcs_prefix),
+            delimiter="/",
+        )
+    elif max_workers is None:
+        blob_pages = _list_blob_pages(storage_client, gcs_bucket_name, gcs_prefix)
+    else:
+        blob_pages = _list_blob_pages_concurrently(
+            storage_client, gcs_bucket_name, gcs_prefix, max_workers
+        )
 
-        if blob.content_type not in constants.VALID_MIME_TYPES:
-            print(f"Skipping file {blob.name}. Invalid Mime Type {blob.content_type}.")
-            continue
+    documents = itertools.chain.from_iterable(
+        _gcs_document_pages(blob_pages, gcs_bucket_name)
+    )
+    return _batches_from_documents(documents, batch_size)
 
-        if blob.size > constants.BATCH_MAX_FILE_SIZE:
-            print(
-                f"Skipping file {blob.name}. File size must be less than {constants.BATCH_MAX_FILE_SIZE} bytes. File size is {blob.size} bytes."
-            )
-            continue
 
-        if len(batch) == batch_size:
-            batches.append(
-                documentai.BatchDocumentsInputConfig(
-                    gcs_documents=documentai.GcsDocuments(documents=batch)
-                )
-            )
-            batch = []
+def create_batches(
+    gcs_bucket_name: str,
+    gcs_prefix: str,
+    batch_size: Optional[int] = constants.BATCH_MAX_FILES,
+    max_workers: Optional[int] = None,
+    recursive: Optional[bool] = True,
+) -> List[documentai.BatchDocumentsInputConfig]:
+    """Create batches of documents in Cloud Storage to process with `batch_process_documents()`.
 
-        batch.append(
-            documentai.GcsDocument(
-                gcs_uri=f"gs://{gcs_bucket_name}/{blob.name}",
-                mime_type=blob.content_type,
-            )
-        )
+    Args:
+        gcs_bucket_name (str):
+            Required. The name of the gcs bucket.
 
-    if batch != []:
-        # Append the last batch, which could be less than `batch_size`
-        batches.append(
-            documentai.BatchDocumentsInputConfig(
-                gcs_documents=documentai.GcsDocuments(documents=batch)
-            )
-        )
+            Format: `gs://bucket/optional_folder/target_folder/` where gcs_bucket_name=`bucket`.
+        gcs_prefix (str):
+            Required. The prefix of the json files in the `target_folder`
 
-    return batches
+            Format: `gs://bucket/optional_folder/target_folder/` where gcs_prefix=`optional_folder/target_folder`.
+        batch_size (Optional[int]):
+            Optional. Size of each batch of documents. Default is `50`.
+        max_workers (Optional[int]):
+            Optional. Maximum number of threads used to list the sub-folders of `gcs_prefix`
+            concurrently. Default is `None`, which lists all documents sequentially.
+        recursive (Optional[bool]):
+            Optional. Whether to include documents in sub-folders of `gcs_prefix`. Default is `True`.
+            `max_workers` is ignored when `False`.
+
+    Returns:
+        List[documentai.BatchDocumentsInputConfig]:
+            A list of `BatchDocumentsInputConfig`, each corresponding to one batch.
+    """
+    return list(
+        iter_batches(
+            gcs_bucket_name=gcs_bucket_name,
+            gcs_prefix=gcs_prefix,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            recursive=recursive,
+        )
+    )
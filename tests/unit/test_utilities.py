@@ -18,6 +18,7 @@ import pytest
 
 from google.cloud import storage
 from google.cloud.documentai_toolbox.utilities import utilities
+from requests import adapters
 
 # try/except added for compatibility with python < 3.8
 try:
@@ -30,6 +31,13 @@ test_bucket = "test-directory"
 test_prefix = "documentai/input"
 
 
+@pytest.fixture(autouse=True)
+def clear_storage_client_cache():
+    utilities._get_shared_storage_client.cache_clear()
+    yield
+    utilities._get_shared_storage_client.cache_clear()
+
+
 @mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
 def test_print_gcs_document_tree_with_one_folder(mock_storage, capfd):
     client = mock_storage.Client.return_value
@@ -58,6 +66,9 @@ def test_print_gcs_document_tree_with_one_folder(mock_storage, capfd):
     utilities.print_gcs_document_tree(gcs_bucket_name="test-directory", gcs_prefix="/")
 
     mock_storage.Client.assert_called_once()
+    client.list_blobs.assert_called_once_with(
+        "test-directory", prefix="/", fields="items(name),nextPageToken"
+    )
 
     out, err = capfd.readouterr()
     assert (
@@ -182,18 +193,24 @@ def test_create_batches_with_3_documents(mock_storage, capfd):
 
     mock_blobs = []
     for i in range(3):
-        mock_blob = mock.Mock(
-            name=f"test_file{i}.pdf", content_type="application/pdf", size=1024
-        )
-        mock_blob.name.endswith.return_value = False
+        mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+        mock_blob.name = f"test_file{i}.pdf"
         mock_blobs.append(mock_blob)
-    client.list_blobs.return_value = mock_blobs
+    client.list_blobs.return_value.pages = [mock_blobs]
 
     actual = utilities.create_batches(
         gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
     )
 
     mock_storage.Client.assert_called_once()
+    client.list_blobs.assert_called_once_with(
+        test_bucket,
+        prefix=test_prefix,
+        delimiter=None,
+        page_size=1000,
+        retry=utilities._LIST_BLOBS_RETRY,
+        fields="items(name,size,contentType),nextPageToken",
+    )
 
     out, err = capfd.readouterr()
     assert out == ""
@@ -201,6 +218,35 @@ def test_create_batches_with_3_documents(mock_storage, capfd):
     assert len(actual[0].gcs_documents.documents) == 3
 
 
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_multiple_pages(mock_storage, capfd):
+    client = mock_storage.Client.return_value
+    mock_bucket = mock.Mock()
+    client.Bucket.return_value = mock_bucket
+
+    mock_pages = []
+    for page in range(3):
+        mock_blobs = []
+        for i in range(30):
+            mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+            mock_blob.name = f"test_file{page}_{i}.pdf"
+            mock_blobs.append(mock_blob)
+        mock_pages.append(mock_blobs)
+    client.list_blobs.return_value.pages = mock_pages
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
+    )
+
+    mock_storage.Client.assert_called_once()
+
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert len(actual) == 2
+    assert len(actual[0].gcs_documents.documents) == 50
+    assert len(actual[1].gcs_documents.documents) == 40
+
+
 def test_create_batches_with_invalid_batch_size(capfd):
     with pytest.raises(ValueError):
         utilities.create_batches(
@@ -208,10 +254,18 @@ def test_create_batches_with_invalid_batch_size(capfd):
         )
 
         out, err = capfd.readouterr()
-        assert "Batch size must be less than" in out
+        assert "Batch size must be between 1 and" in out
         assert err
 
 
+@pytest.mark.parametrize("batch_size", [0, -1])
+def test_create_batches_with_non_positive_batch_size(batch_size):
+    with pytest.raises(ValueError, match="Batch size must be between 1 and 50"):
+        utilities.create_batches(
+            gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, batch_size=batch_size
+        )
+
+
 @mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
 def test_create_batches_with_large_folder(mock_storage, capfd):
     client = mock_storage.Client.return_value
@@ -220,12 +274,10 @@ def test_create_batches_with_large_folder(mock_storage, capfd):
 
     mock_blobs = []
     for i in range(96):
-        mock_blob = mock.Mock(
-            name=f"test_file{i}.pdf", content_type="application/pdf", size=1024
-        )
-        mock_blob.name.endswith.return_value = False
+        mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+        mock_blob.name = f"test_file{i}.pdf"
         mock_blobs.append(mock_blob)
-    client.list_blobs.return_value = mock_blobs
+    client.list_blobs.return_value.pages = [mock_blobs]
 
     actual = utilities.create_batches(
         gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
@@ -241,16 +293,14 @@ def test_create_batches_with_large_folder(mock_storage, capfd):
 
 
 @mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
-def test_create_batches_with_invalid_file_type(mock_storage, capfd):
+def test_create_batches_with_invalid_file_type(mock_storage, caplog):
     client = mock_storage.Client.return_value
     mock_bucket = mock.Mock()
     client.Bucket.return_value = mock_bucket
 
-    mock_blob = mock.Mock(
-        name="test_file.json", content_type="application/json", size=1024
-    )
-    mock_blob.name.endswith.return_value = False
-    client.list_blobs.return_value = [mock_blob]
+    mock_blob = mock.Mock(content_type="application/json", size=1024)
+    mock_blob.name = "test_file.json"
+    client.list_blobs.return_value.pages = [[mock_blob]]
 
     actual = utilities.create_batches(
         gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
@@ -258,29 +308,314 @@ def test_create_batches_with_invalid_file_type(mock_storage, capfd):
 
     mock_storage.Client.assert_called_once()
 
-    out, err = capfd.readouterr()
-    assert "Invalid Mime Type" in out
+    assert "Invalid Mime Type application/json" in caplog.text
     assert actual == []
 
 
 @mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
-def test_create_batches_with_large_file(mock_storage, capfd):
+def test_create_batches_with_large_file(mock_storage, caplog):
     client = mock_storage.Client.return_value
     mock_bucket = mock.Mock()
     client.Bucket.return_value = mock_bucket
 
-    mock_blob = mock.Mock(
-        name="test_file.pdf", content_type="application/pdf", size=2073741824
+    mock_blob = mock.Mock(content_type="application/pdf", size=2073741824)
+    mock_blob.name = "test_file.pdf"
+    client.list_blobs.return_value.pages = [[mock_blob]]
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
     )
-    mock_blob.name.endswith.return_value = False
-    client.list_blobs.return_value = [mock_blob]
+
+    mock_storage.Client.assert_called_once()
+
+    assert "File size must be less than" in caplog.text
+    assert actual == []
+
+
+def create_mock_list_blobs(names):
+    r"""Returns a `list_blobs` side effect that lists `names` like Cloud Storage."""
+
+    def list_blobs(bucket, prefix, delimiter=None, **kwargs):
+        items = []
+        prefixes = set()
+        for name in sorted(names):
+            if not name.startswith(prefix):
+                continue
+            if delimiter and delimiter in name[len(prefix) :]:
+                rest = name[len(prefix) :]
+                prefixes.add(prefix + rest[: rest.index(delimiter) + 1])
+                continue
+            mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+            mock_blob.name = name
+            items.append(mock_blob)
+        return mock.Mock(pages=[items], prefixes=prefixes)
+
+    return list_blobs
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_max_workers(mock_storage, capfd):
+    client = mock_storage.Client.return_value
+    names = [f"{test_prefix}/test_file{i}.pdf" for i in range(2)]
+    for folder in ["a", "b"]:
+        names += [f"{test_prefix}/{folder}/test_file{i}.pdf" for i in range(30)]
+    client.list_blobs.side_effect = create_mock_list_blobs(names)
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, max_workers=2
+    )
+
+    mock_storage.Client.assert_called_once()
+    listed_prefixes = [call[1]["prefix"] for call in client.list_blobs.call_args_list]
+    assert sorted(listed_prefixes) == [
+        "documentai/input",
+        "documentai/input/",
+        "documentai/input/a/",
+        "documentai/input/b/",
+    ]
+
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert len(actual) == 2
+    assert len(actual[0].gcs_documents.documents) == 50
+    assert len(actual[1].gcs_documents.documents) == 12
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_max_workers_keeps_listing_order(mock_storage):
+    client = mock_storage.Client.return_value
+    names = [
+        f"{test_prefix}/0.pdf",
+        f"{test_prefix}/a/x.pdf",
+        f"{test_prefix}/b.pdf",
+        f"{test_prefix}/c/y.pdf",
+        f"{test_prefix}/z.pdf",
+    ]
+    client.list_blobs.side_effect = create_mock_list_blobs(names)
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, max_workers=2
+    )
+
+    assert [document.gcs_uri for document in actual[0].gcs_documents.documents] == [
+        f"gs://{test_bucket}/{name}" for name in names
+    ]
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_max_workers_matches_sequential_listing(mock_storage):
+    client = mock_storage.Client.return_value
+    names = [
+        f"{test_prefix}.pdf",
+        f"{test_prefix}/",
+        f"{test_prefix}/a.pdf",
+        f"{test_prefix}/sub/b.pdf",
+        f"{test_prefix}2/c.pdf",
+    ]
+    client.list_blobs.side_effect = create_mock_list_blobs(names)
+
+    def batched_uris(max_workers):
+        batches = utilities.create_batches(
+            gcs_bucket_name=test_bucket,
+            gcs_prefix=test_prefix,
+            max_workers=max_workers,
+        )
+        return [
+            document.gcs_uri
+            for batch in batches
+            for document in batch.gcs_documents.documents
+        ]
+
+    sequential = batched_uris(max_workers=None)
+
+    assert len(sequential) == 4
+    assert batched_uris(max_workers=2) == sequential
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_iter_batches_with_max_workers_lists_sub_folders_on_demand(mock_storage):
+    client = mock_storage.Client.return_value
+    names = [f"{test_prefix}/{folder}/test_file.pdf" for folder in "abcdef"]
+    client.list_blobs.side_effect = create_mock_list_blobs(names)
+
+    actual = utilities.iter_batches(
+        gcs_bucket_name=test_bucket,
+        gcs_prefix=test_prefix,
+        batch_size=1,
+        max_workers=1,
+    )
+    next(actual)
+    actual.close()
+
+    # The two first-level listings, the consumed sub-folder and at most one listed ahead.
+    assert client.list_blobs.call_count <= 4
+
+
+@pytest.mark.parametrize("max_workers", [0, -1])
+def test_iter_batches_with_invalid_max_workers(max_workers):
+    with pytest.raises(ValueError, match="max_workers must be greater than 0"):
+        utilities.iter_batches(
+            gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, max_workers=max_workers
+        )
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_image_files(mock_storage, capfd):
+    client = mock_storage.Client.return_value
+    mock_bucket = mock.Mock()
+    client.Bucket.return_value = mock_bucket
+
+    mock_blobs = []
+    for mime_type in ["image/bmp", "image/gif"]:
+        mock_blob = mock.Mock(content_type=mime_type, size=1024)
+        mock_blob.name = "test_file"
+        mock_blobs.append(mock_blob)
+    client.list_blobs.return_value.pages = [mock_blobs]
 
     actual = utilities.create_batches(
         gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
     )
 
+    out, err = capfd.readouterr()
+    assert out == ""
+    assert len(actual) == 1
+    assert len(actual[0].gcs_documents.documents) == 2
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_iter_batches_with_large_folder(mock_storage, capfd):
+    client = mock_storage.Client.return_value
+    mock_bucket = mock.Mock()
+    client.Bucket.return_value = mock_bucket
+
+    mock_blobs = []
+    for i in range(96):
+        mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+        mock_blob.name = f"test_file{i}.pdf"
+        mock_blobs.append(mock_blob)
+    client.list_blobs.return_value.pages = [mock_blobs]
+
+    actual = utilities.iter_batches(gcs_bucket_name=test_bucket, gcs_prefix=test_prefix)
+
+    assert not isinstance(actual, list)
+    assert len(next(actual).gcs_documents.documents) == 50
+    assert len(next(actual).gcs_documents.documents) == 46
+    with pytest.raises(StopIteration):
+        next(actual)
+
+
+def test_iter_batches_with_invalid_batch_size():
+    with pytest.raises(ValueError, match="Batch size must be between 1 and 50"):
+        utilities.iter_batches(
+            gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, batch_size=51
+        )
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_reuses_storage_client(mock_storage):
+    client = mock_storage.Client.return_value
+    client._http.get_adapter.return_value = adapters.HTTPAdapter()
+    client.list_blobs.return_value.pages = []
+
+    utilities.create_batches(gcs_bucket_name=test_bucket, gcs_prefix=test_prefix)
+    utilities.create_batches(gcs_bucket_name=test_bucket, gcs_prefix=test_prefix)
+
     mock_storage.Client.assert_called_once()
+    client._http.mount.assert_called_once()
+    assert client.list_blobs.call_count == 2
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_keeps_custom_https_adapter(mock_storage):
+    class MutualTlsAdapter(adapters.HTTPAdapter):
+        pass
+
+    client = mock_storage.Client.return_value
+    client._http.get_adapter.return_value = MutualTlsAdapter()
+    client.list_blobs.return_value.pages = []
+
+    utilities.create_batches(gcs_bucket_name=test_bucket, gcs_prefix=test_prefix)
+
+    client._http.mount.assert_not_called()
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_non_recursive(mock_storage, capfd):
+    client = mock_storage.Client.return_value
+
+    mock_blobs = []
+    for name in ["documentai/input/", "documentai/input/test_file.pdf"]:
+        mock_blob = mock.Mock(content_type="application/pdf", size=1024)
+        mock_blob.name = name
+        mock_blobs.append(mock_blob)
+    client.list_blobs.return_value.pages = [mock_blobs]
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket,
+        gcs_prefix="documentai/input/",
+        max_workers=2,
+        recursive=False,
+    )
+
+    client.list_blobs.assert_called_once_with(
+        test_bucket,
+        prefix="documentai/input/",
+        delimiter="/",
+        page_size=1000,
+        retry=utilities._LIST_BLOBS_RETRY,
+        fields="items(name,size,contentType),nextPageToken",
+    )
 
     out, err = capfd.readouterr()
-    assert "File size must be less than" in out
-    assert actual == []
+    assert out == ""
+    assert len(actual) == 1
+    assert actual[0].gcs_documents.documents[0].gcs_uri == (
+        "gs://test-directory/documentai/input/test_file.pdf"
+    )
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_non_recursive_without_trailing_slash(mock_storage):
+    client = mock_storage.Client.return_value
+    names = [
+        f"{test_prefix}/",
+        f"{test_prefix}/test_file.pdf",
+        f"{test_prefix}/a/test_file.pdf",
+        f"{test_prefix}2/test_file.pdf",
+    ]
+    client.list_blobs.side_effect = create_mock_list_blobs(names)
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix, recursive=False
+    )
+
+    assert len(actual) == 1
+    assert [document.gcs_uri for document in actual[0].gcs_documents.documents] == [
+        f"gs://{test_bucket}/{test_prefix}/test_file.pdf"
+    ]
+
+
+@mock.patch("google.cloud.documentai_toolbox.wrappers.document.storage")
+def test_create_batches_with_folder_placeholder(mock_storage, caplog):
+    client = mock_storage.Client.return_value
+
+    mock_blobs = []
+    for name, content_type in [
+        (f"{test_prefix}/", "application/x-directory"),
+        (f"{test_prefix}/test_file.pdf", "application/pdf"),
+        (f"{test_prefix}/test_file.json", "application/json"),
+    ]:
+        mock_blob = mock.Mock(content_type=content_type, size=1024)
+        mock_blob.name = name
+        mock_blobs.append(mock_blob)
+    client.list_blobs.return_value.pages = [mock_blobs]
+
+    actual = utilities.create_batches(
+        gcs_bucket_name=test_bucket, gcs_prefix=test_prefix
+    )
+
+    assert len(actual) == 1
+    assert len(actual[0].gcs_documents.documents) == 1
+    assert [record.getMessage() for record in caplog.records] == [
+        f"Skipping file {test_prefix}/test_file.json. Invalid Mime Type application/json."
+    ]